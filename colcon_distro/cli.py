@@ -5,6 +5,7 @@ import uvloop
 
 from .config import add_config_args, get_config
 from .database import Database
+from .download import close_http_client
 from .model import Model
 
 logger = logging.getLogger(__name__)
@@ -15,7 +16,7 @@ def get_arg_parser():
     ap = argparse.ArgumentParser()
     add_config_args(ap)
     ap.add_argument("dist")
-    ap.add_argument("ref")
+    ap.add_argument("ref", nargs='+')
     ap.add_argument("--debug", default=False, action='store_true')
     ap.add_argument("--verbose", default=False, action='store_true')
     return ap
@@ -29,10 +30,23 @@ def main():
     db = Database(config)
     model = Model(config, db)
 
-    asyncio.set_event_loop(uvloop.new_event_loop())
-    result = asyncio.run(model.get_set(args.dist, args.ref))
-    len_packages = sum([len(x[-1]) for x in result])
-    if args.verbose:
-        for repo_state in result:
-            print(repo_state)
-    print(f"Retrieved {len(result)} repo records, containing {len_packages} packages.")
+    async def get_sets():
+        # All refs are processed concurrently on the one event loop, sharing the database
+        # connection and any repo states which they have in common. Unless the full
+        # result is to be printed, only ask for a summary of the package counts.
+        get_fn = model.get_set if args.verbose else model.get_set_summary
+        try:
+            async with db:
+                return await asyncio.gather(*(get_fn(args.dist, ref) for ref in args.ref))
+        finally:
+            await close_http_client()
+
+    results = uvloop.run(get_sets())
+    for ref, result in zip(args.ref, results):
+        if args.verbose:
+            for desc in result:
+                print(desc.name, desc.to_dict())
+            len_packages = sum([len(desc.packages) for desc in result])
+        else:
+            len_packages = sum([count for name, count in result])
+        print(f"Retrieved {len(result)} repo records for {ref}, containing {len_packages} packages.")
@@ -2,7 +2,12 @@ from collections import namedtuple
 import contextlib
 import os
 from pathlib import Path
-import toml
+import threading
+
+try:
+    import tomllib
+except ImportError:  # pragma: no cover
+    import tomli as tomllib  # type: ignore
 
 
 DistroConfig = namedtuple('DistroConfig', 'repository distributions branches python_version')
@@ -18,8 +23,8 @@ class Config:
         self.args = args
         config_file = Path(args.config_file or self.DEFAULT_CONFIG_FILE)
         if config_file.exists():
-            with open(config_file, 'r') as f:
-                self.toml = toml.load(f)
+            with open(config_file, 'rb') as f:
+                self.toml = tomllib.load(f)
             self.distro = DistroConfig(**self.toml['distro'])
             os.environ['ROS_PYTHON_VERSION'] = str(self.distro.python_version)
         else:
@@ -55,10 +60,13 @@ def add_config_args(argparser):
 
 
 _config = None
+_config_lock = threading.Lock()
 
 
 def get_config(args):
     global _config
     if not _config:
-        _config = Config(args)
+        with _config_lock:
+            if not _config:
+                _config = Config(args)
     return _config
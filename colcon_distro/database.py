@@ -9,11 +9,11 @@ and also wrapping queries with a basic method interface.
 import aiosqlite
 import asyncio
 import contextlib
-import json
+import importlib.resources
 import logging
-import pkg_resources
+import orjson
 import sqlite3
-from typing import Iterable
+from typing import Iterable, List, Tuple
 
 from .repository_descriptor import RepositoryDescriptor
 
@@ -21,10 +21,6 @@ from .repository_descriptor import RepositoryDescriptor
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# TODO: Would be interesting to profile what the overhead is of passing all these small
-# sqlite operations to the other thread to do them "asyncronously". We could probably
-# save a bunch of this is we did the insertions in batches.
-
 
 class RepositoryNotFound(Exception):
     pass
@@ -34,6 +30,10 @@ class RepositorySetNotFound(Exception):
     pass
 
 
+class DistroFileNotFound(Exception):
+    pass
+
+
 class Database:
     """
     This class is a low-level wrapper on the SQLite interface, supplying function wrappers
@@ -44,6 +44,16 @@ class Database:
 
     SCHEMA_SCRIPT = "schema.sql"
     PRAGMA_FOREIGN_KEYS = "PRAGMA foreign_keys=1"
+    # WAL with NORMAL sync only needs an fsync at checkpoints rather than every commit, and
+    # the memory-mapped reads avoid a syscall per page on the big fetch_set query.
+    PRAGMA_PERFORMANCE = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;"""
+    # The long-lived writer connection also gets a larger page cache (negative is in KiB).
+    # This is per connection, so the readers, which are served from the mmap, keep the default.
+    PRAGMA_WRITER_CACHE = "PRAGMA cache_size=-64000"
     FETCH_SET_QUERY = """
     SELECT name, type, url, version, metadata, package_descriptors
     FROM repo_states
@@ -51,66 +61,127 @@ class Database:
     JOIN sets ON set_repo_states.set_id == sets.id
     WHERE sets.dist = ? AND sets.ref = ?
     ORDER BY name"""
+    FETCH_SET_SUMMARY_QUERY = """
+    SELECT name, json_array_length(package_descriptors)
+    FROM repo_states
+    JOIN set_repo_states ON repo_states.id = set_repo_states.repo_state_id
+    JOIN sets ON set_repo_states.set_id == sets.id
+    WHERE sets.dist = ? AND sets.ref = ?
+    ORDER BY name"""
     FETCH_REPO_STATE_QUERY = """
     SELECT id, metadata, package_descriptors
     FROM repo_states
     WHERE name = ? AND type = ? AND url = ? AND version = ?"""
+    FETCH_DISTRO_FILE_QUERY = """
+    SELECT content
+    FROM distro_files
+    WHERE repository = ? AND version = ? AND path = ?"""
+    INSERT_DISTRO_FILE_QUERY = """
+    INSERT OR IGNORE INTO distro_files (repository, version, path, content) VALUES (?, ?, ?, ?)"""
     INSERT_SET_QUERY = """
     INSERT INTO sets (dist, ref, last_updated) VALUES (?, ?, ?)"""
+    # The no-op conflict update is so that the existing row's id is still returned if some
+    # other request has concurrently inserted the same repo state.
     INSERT_REPO_STATE_QUERY = """
-    INSERT INTO repo_states (name, type, url, version, metadata, package_descriptors) VALUES (?, ?, ?, ?, ?, ?)"""
+    INSERT INTO repo_states (name, type, url, version, metadata, package_descriptors)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (name, type, url, version) DO UPDATE SET name = excluded.name
+    RETURNING id"""
     INSERT_SET_REPO_STATES_QUERY = """
     INSERT INTO set_repo_states (set_id, repo_state_id) VALUES (?, ?)"""
 
     def __init__(self, config):
         self.config = config
         filepath = self.config.get_database_filepath()
-        if not filepath.exists():
-            self.initialize(filepath)
-        self.connection = Connection(filepath, self.connect_fn)
+        self.initialize(filepath)
+        self.pool = ConnectionPool(filepath, self.connect_fn, readers=self.config.get_parallelism())
+
+    async def __aenter__(self):
+        await self.pool.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.pool.close()
 
     def initialize(self, filepath: str) -> None:
         """
-        Initializes a new empty database; this only ever happens at startup, so we
-        just do it synchronously.
+        Initializes a new empty database, or adds any tables missing from an existing one
+        (the schema script is idempotent). This only ever happens at startup, so we just do
+        it synchronously. The performance pragmas are applied first, so that the file is in
+        WAL mode (which persists) before the schema is written.
         """
-        queries = pkg_resources.resource_string(__name__, self.SCHEMA_SCRIPT).decode()
+        queries = importlib.resources.files(__package__).joinpath(self.SCHEMA_SCRIPT).read_text()
         db = sqlite3.connect(filepath)
+        db.executescript(self.PRAGMA_PERFORMANCE)
         db.executescript(queries)
         db.commit()
         db.close()
 
-    async def connect_fn(self, db) -> None:
+    async def connect_fn(self, db, writer: bool) -> None:
         """
         Callback function for anything we'd like to execute on a newly-opened database connection.
         """
         await db.execute(self.PRAGMA_FOREIGN_KEYS)
+        await db.executescript(self.PRAGMA_PERFORMANCE)
+        if writer:
+            await db.execute(self.PRAGMA_WRITER_CACHE)
 
     async def fetch_set(self, dist_name: str, ref: str) -> Iterable[RepositoryDescriptor]:
         """
         Return either an iterable of RepositoryDescriptor objects if the set is in the
         database, or raise RepositorySetNotFound if it is not.
         """
-        async with self.connection() as db:
-            await db.execute(self.FETCH_SET_QUERY, (dist_name, ref))
+        async with self.pool.reader() as db:
             cursor = await db.execute(self.FETCH_SET_QUERY, (dist_name, ref))
+            all_data = await cursor.fetchall()
+        if not all_data:
+            raise RepositorySetNotFound
+        return [self._descriptor_from_row(*data) for data in all_data]
+
+    async def fetch_set_summary(self, dist_name: str, ref: str) -> List[Tuple[str, int]]:
+        """
+        Return a list of (name, package count) tuples for the set's repositories, without
+        transferring or parsing the packages themselves, or raise RepositorySetNotFound if
+        the set is not in the database.
+        """
+        async with self.pool.reader() as db:
+            cursor = await db.execute(self.FETCH_SET_SUMMARY_QUERY, (dist_name, ref))
             if all_data := await cursor.fetchall():
-                repository_descriptors = []
-                for data in all_data:
-                    desc = RepositoryDescriptor()
-                    desc.name = data[0]
-                    desc.type = data[1]
-                    desc.url = data[2]
-                    desc.version = data[3]
-                    metadata_str = data[4]
-                    if metadata_str != "":
-                        desc.metadata = json.loads(metadata_str)
-                    desc.parse_packages_dicts(json.loads(data[5]))
-                    repository_descriptors.append(desc)
-                return repository_descriptors
+                return list(all_data)
             else:
                 raise RepositorySetNotFound
 
+    @staticmethod
+    def _descriptor_from_row(name, type, url, version, metadata_str, packages_str) -> RepositoryDescriptor:
+        desc = RepositoryDescriptor()
+        desc.name, desc.type, desc.url, desc.version = name, type, url, version
+        if metadata_str != "":
+            desc.metadata = orjson.loads(metadata_str)
+        desc.parse_packages_dicts(orjson.loads(packages_str))
+        return desc
+
+    async def fetch_distro_file(self, repository: str, version: str, path: str) -> dict:
+        """
+        Return the parsed contents of a rosdistro file at a particular version, or raise
+        DistroFileNotFound if it is not in the database.
+        """
+        async with self.pool.reader() as db:
+            cursor = await db.execute(self.FETCH_DISTRO_FILE_QUERY, (repository, version, path))
+            if result := await cursor.fetchone():
+                return orjson.loads(result[0])
+            else:
+                raise DistroFileNotFound
+
+    async def insert_distro_file(self, repository: str, version: str, path: str, content: dict) -> None:
+        """
+        Insert the parsed contents of a rosdistro file, serialized as JSON. If the same file
+        has already been inserted, this is a no-op.
+        """
+        async with self.pool.writer() as db:
+            query_args = (repository, version, path, orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS).decode())
+            await db.execute(self.INSERT_DISTRO_FILE_QUERY, query_args)
+            await db.commit()
+
     async def fetch_repo_state(self, desc: RepositoryDescriptor) -> None:
         """
         Uses the identity fields in the passed-in descriptor to search for it in the
@@ -119,87 +190,123 @@ class Database:
         """
         query_args = desc.identity()
         assert query_args
-        async with self.connection() as db:
+        async with self.pool.reader() as db:
             cursor = await db.execute(self.FETCH_REPO_STATE_QUERY, query_args)
             result = await cursor.fetchall()
             if result:
                 repo_state_id, metadata_str, packages_str = result[0]
-                desc.metadata = json.loads(metadata_str)
-                packages_dicts = json.loads(packages_str)
+                desc.metadata = orjson.loads(metadata_str)
+                packages_dicts = orjson.loads(packages_str)
                 desc.parse_packages_dicts(packages_dicts)
                 desc.metadata['repo_state_id'] = repo_state_id
             else:
                 raise RepositoryNotFound
 
-    async def insert_repo_state(self, desc: RepositoryDescriptor) -> None:
+    async def insert_snapshot(self, dist_name: str, ref: str, descs: List[RepositoryDescriptor]) -> None:
         """
-        Insert a repo state, setting the repo_state_id in the descriptor's metadata dict.
-        If the row already exists, this query will fail due to db constraints.
+        Insert a new set row from dist_name and ref, along with its repo states, all in a
+        single transaction. Repo states are inserted as needed, setting the repo_state_id in
+        each descriptor's metadata dict; descriptors which already have a repo_state_id are
+        skipped, and rows which were concurrently inserted by someone else are left as-is.
+        If anything fails, the transaction is rolled back and the repo_state_ids which were
+        set by this call are removed again. Requires SQLite 3.35 or newer, for the RETURNING
+        clause.
         """
         mi = self.config.get_metadata_inclusions()
-        async with self.connection() as db:
-            query_args = (
-                desc.name,
-                desc.type,
-                desc.url,
-                desc.version,
-                json.dumps(desc.metadata),
-                json.dumps(desc.packages_dicts(mi)),
-            )
-            cursor = await db.execute(self.INSERT_REPO_STATE_QUERY, query_args)
-            desc.metadata['repo_state_id'] = cursor.lastrowid
-            await db.commit()
+        inserted_descs = []
+        async with self.pool.writer() as db:
+            try:
+                for desc in descs:
+                    if 'repo_state_id' in desc.metadata:
+                        continue
+                    query_args = (
+                        desc.name,
+                        desc.type,
+                        desc.url,
+                        desc.version,
+                        orjson.dumps(desc.metadata).decode(),
+                        orjson.dumps(desc.packages_dicts(mi)).decode(),
+                    )
+                    rows = await db.execute_fetchall(self.INSERT_REPO_STATE_QUERY, query_args)
+                    desc.metadata['repo_state_id'] = rows[0][0]
+                    inserted_descs.append(desc)
 
-    async def insert_set(self, dist_name: str, ref: str, repo_state_ids: Iterable[int]) -> None:
-        """
-        Insert a new set row from dist_name, name, and set of ids, all of which must
-        exist in the repo states table or this query will fail due to db constraints.
-        """
-        async with self.connection() as db:
-            cursor = await db.execute(self.INSERT_SET_QUERY, (dist_name, ref, None))
-            set_id = cursor.lastrowid
-            query_args = [(set_id, r) for r in repo_state_ids]
-            await db.executemany(self.INSERT_SET_REPO_STATES_QUERY, query_args)
-            await db.commit()
+                cursor = await db.execute(self.INSERT_SET_QUERY, (dist_name, ref, None))
+                set_id = cursor.lastrowid
+                set_rows = ((set_id, desc.metadata['repo_state_id']) for desc in descs)
+                await db.executemany(self.INSERT_SET_REPO_STATES_QUERY, set_rows)
+                await db.commit()
+            except BaseException:
+                # Otherwise the writer is left mid-transaction for whoever uses it next, and
+                # the descriptors point at rows which no longer exist.
+                await db.rollback()
+                for desc in inserted_descs:
+                    del desc.metadata['repo_state_id']
+                raise
 
 
-class Connection:
+class ConnectionPool:
     """
-    This manager class provides a few important capabilities to our sqlite connection.
-    First, it mutexes it, so that commits from one coroutine don't get interleaved with
-    queries from another, since sqlite has no built in concept of there being multiple
-    clients or concurrent transactions going on. Second, it starts a background task
-    which on cancelation closes the connection.
-
-    A common instance of this class is used as a context manager. It yields the database
-    handle and the caller must not store or continue to use it when the context has exited.
+    This manager class provides a few important capabilities to our sqlite connections.
+    First, it holds a single writer connection and mutexes it, so that commits from one
+    coroutine don't get interleaved with queries from another, since sqlite has no built in
+    concept of there being multiple clients or concurrent transactions going on. Second, it
+    holds a small pool of reader connections, which in WAL mode can all query concurrently
+    with each other and with the writer. Third, all of these are held for the whole lifetime
+    of the process, and are explicitly opened and closed by the owner, usually by way of using
+    the :class:`Database` as an async context manager.
+
+    The ``reader()`` and ``writer()`` methods are used as context managers. They yield a
+    database handle and the caller must not store or continue to use it when the context
+    has exited.
     """
-    def __init__(self, filepath, connect_fn=None):
+    def __init__(self, filepath, connect_fn=None, readers=1):
         # Lazy-initialize all async stuff so we don't get the wrong loop if this
         # object is constructed ahead of the loop starting.
-        self._handle = None
-        self._lock = None
+        self._writer = None
+        self._writer_lock = None
+        self._readers = None
+        self._readers_count = readers
         self._filepath = filepath
         self._connect_fn = connect_fn
 
+    async def _connect(self, writer=False):
+        handle = await aiosqlite.connect(self._filepath)
+        if self._connect_fn:
+            await self._connect_fn(handle, writer)
+        return handle
+
+    async def open(self):
+        logger.info(f"Opening database at {self._filepath}.")
+        self._writer_lock = asyncio.Lock()
+        self._writer = await self._connect(writer=True)
+        self._readers = asyncio.Queue()
+        for _ in range(self._readers_count):
+            self._readers.put_nowait(await self._connect())
+
+    async def close(self):
+        logger.info("Closing database.")
+        for _ in range(self._readers_count):
+            await (await self._readers.get()).close()
+        async with self._writer_lock:
+            await self._writer.close()
+            self._writer = None
+
+    def _check_open(self):
+        if not self._writer:
+            raise RuntimeError("Database connection used before being opened.")
+
     @contextlib.asynccontextmanager
-    async def __call__(self):
-        self._lock = self._lock or asyncio.Lock()
-        async with self._lock:
-            if not self._handle:
-                logger.info(f"Opening database at {self._filepath}.")
-                self._handle = await aiosqlite.connect(self._filepath)
-                if self._connect_fn:
-                    await self._connect_fn(self._handle)
-                asyncio.create_task(self._closer())
-            yield self._handle
-
-    async def _closer(self):
+    async def reader(self):
+        self._check_open()
+        handle = await self._readers.get()
         try:
-            while True:
-                await asyncio.sleep(60)
+            yield handle
         finally:
-            async with self._lock:
-                logger.info("Closing database.")
-                await self._handle.close()
-                self._handle = None
+            self._readers.put_nowait(handle)
+
+    @contextlib.asynccontextmanager
+    async def writer(self):
+        self._check_open()
+        async with self._writer_lock:
+            yield self._writer
@@ -12,6 +12,7 @@ from colcon_core.package_discovery import discover_packages
 from colcon_core.package_identification import get_package_identification_extensions
 
 import argparse
+import copy
 
 
 def discover_augmented_packages(repo_dir):
@@ -31,15 +32,21 @@ def discover_augmented_packages(repo_dir):
     return descriptors
 
 
+# See: https://github.com/colcon/colcon-core/issues/378
+_DISCOVERY_ARGS = argparse.Namespace(
+    base_paths=None,
+    ignore_user_meta=True,
+    packages_ignore_regex=None,
+    packages_ignore=None,
+    paths=None,
+    metas=['./colcon.meta'])
+
+
 def _get_discovery_args(path):
-    # See: https://github.com/colcon/colcon-core/issues/378
-    argparse_ns = argparse.Namespace(
-        base_paths=[path],
-        ignore_user_meta=True,
-        packages_ignore_regex=None,
-        packages_ignore=None,
-        paths=None,
-        metas=['./colcon.meta'])
+    # Only the base path varies between calls, so copy the rest from the template.
+    argparse_ns = copy.copy(_DISCOVERY_ARGS)
+    # Base paths are strings, as they would be coming from the command line.
+    argparse_ns.base_paths = [str(path)]
     return argparse_ns
 
 
@@ -12,6 +12,7 @@ import asyncio
 from abc import ABC, abstractmethod
 import contextlib
 import httpx
+import importlib.util
 import re
 import logging
 import os
@@ -19,6 +20,7 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Dict, Iterable, Optional
 import urllib.parse
+import zlib
 
 from .repository_descriptor import RepositoryDescriptor
 
@@ -26,6 +28,47 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+# A single client is shared by all downloaders so that connections to the git hosts are kept
+# alive and reused, rather than paying for a new TCP and TLS handshake on every request. Its
+# connections belong to the event loop it was created on, so that loop is tracked alongside.
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# HTTP/2 lets concurrent requests to the same host share one connection, but httpx only
+# supports it with the optional h2 package installed, ie. colcon-distro[http2].
+_HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared httpx client for the running event loop, creating it if necessary. A
+    client left over from a different loop (eg, a previous asyncio.run) is not reused.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if not _http_client or _http_client_loop is not loop:
+        limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        # Keep httpx's default timeouts, except that a request waiting on the capped pool
+        # just queues until a connection is free, rather than failing the download.
+        timeout = httpx.Timeout(5.0, pool=None)
+        _http_client = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True,
+                                         http2=_HTTP2_AVAILABLE)
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """
+    Closes the shared httpx client, if it was created on the running event loop. This should
+    be called at shutdown by whoever owns the event loop.
+    """
+    global _http_client, _http_client_loop
+    if _http_client and _http_client_loop is asyncio.get_running_loop():
+        await _http_client.aclose()
+        _http_client = None
+        _http_client_loop = None
+
+
 class DownloadError(RuntimeError):
     """
     General exception for download-related errors.
@@ -38,9 +81,10 @@ class GitDownloader(ABC):
     This abstract class supplies the interface for the host-specific implementations that
     are used by :class:`GitRev`.
     """
+    __slots__ = ()
 
     @abstractmethod
-    async def get_file(self, path: Path) -> bytes:
+    async def get_file(self, path: str) -> bytes:
         """
         Returns contents of a single file from a git remote, using if possible
         a host-specific API that is faster than simply cloning the repo.
@@ -66,15 +110,38 @@ class GitHostTarballDownloader(GitDownloader):
     """
     Generic tarball downloader which is lightly specialized in subclasses for specific hosts.
     """
+    __slots__ = (
+        'server',
+        'repo_path',
+        'version',
+        'base_url',
+        'repo_path_quoted',
+        'tarball_url_path',
+        'file_url_template',
+    )
     headers: Dict[str, str] = {}
     SERVER_REGEX: re.Pattern
     TARBALL_PATH: str
+    FILE_PATH: str
     BASE_URL :str = 'https://{server}'
+    CHUNK_SIZE = 65536
 
-    def __init__(self, **args):
-        self.__dict__.update(args)
-        self.base_url = self.BASE_URL.format(server=self.server)
-        self.repo_path_quoted = urllib.parse.quote(self.repo_path, safe='')
+    def __init__(self, server: str, repo_path: str, version: Optional[str]):
+        self.server = server
+        self.repo_path = repo_path
+        self.version = version
+        self.base_url = self.BASE_URL.format(server=server)
+        self.repo_path_quoted = urllib.parse.quote(repo_path, safe='')
+        # Fill in the per-repo fields of the URL templates once, leaving only the file path
+        # fields to be substituted on each request.
+        url_fields = {
+            'repo_path': repo_path,
+            'repo_path_quoted': self.repo_path_quoted,
+            'version': version,
+        }
+        self.tarball_url_path = self.TARBALL_PATH.format(**url_fields)
+        self.file_url_template = self.FILE_PATH.format(
+            path='{path}', path_quoted='{path_quoted}', **url_fields)
 
     @contextlib.asynccontextmanager
     async def stream_resource(self, url_path):
@@ -82,11 +149,10 @@ class GitHostTarballDownloader(GitDownloader):
         Yields an httpx response object for a resource on the git server.
         """
         url = f"{self.base_url}/{url_path}"
-        async with httpx.AsyncClient() as client:
-            async with client.stream('GET', url, headers=self.headers, follow_redirects=True) as response:
-                if response.status_code != 200:
-                    raise DownloadError(f"HTTP {response.status_code} fetching {url}")
-                yield response
+        async with get_http_client().stream('GET', url, headers=self.headers) as response:
+            if response.status_code != 200:
+                raise DownloadError(f"HTTP {response.status_code} fetching {url}")
+            yield response
 
     @contextlib.asynccontextmanager
     async def stream_repo_file(self, path):
@@ -94,30 +160,59 @@ class GitHostTarballDownloader(GitDownloader):
         Yields an httpx response object for a stream of a repository file.
         """
         path_quoted = urllib.parse.quote(path, safe='')
-        url_path = self.FILE_PATH.format(**locals(), **self.__dict__)
+        url_path = self.file_url_template.format(path=path, path_quoted=path_quoted)
         async with self.stream_resource(url_path) as response:
             yield response
 
-    async def extract_tarball_to(self, path, limit_paths=None):
-        # Originally this was an httpx download, but then the pipes had to be managed
-        # inside asyncio, which was a pain and the performance was significantly worse
-        # compared to this approach. Also, it didn't work with uvloop, which this does.
-        url_path = self.TARBALL_PATH.format(**self.__dict__)
-        header_strs = [f'-H "{k}:{v}"' for k, v in self.headers.items()]
-        curl_cmd = f'curl -L {" ".join(header_strs)} {self.base_url}/{url_path}'
-        tar_cmd = 'tar --extract --verbose --gzip --strip-components=1'
+    async def extract_tarball_to(self, path, limit_paths=None, return_filelist=False):
+        # The archive is streamed over the shared httpx client straight into tar's stdin, which
+        # keeps the host connection alive for reuse and avoids spawning a shell and curl. It is
+        # gunzipped here as it arrives, so that tar is left with only the filesystem writes.
+        url_path = self.tarball_url_path
+        # Tar only lists what it extracts if the caller wants the list back.
+        tar_args = ['--extract', '--strip-components=1']
+        if return_filelist:
+            tar_args.append('--verbose')
         if limit_paths and '.' not in limit_paths:
-            tar_cmd = ' '.join([tar_cmd, "--wildcards", "--no-wildcards-match-slash"]
-                               + ["*/%s" % p for p in limit_paths])
-        tar_proc = await asyncio.create_subprocess_shell(
-            f"{curl_cmd} | {tar_cmd}", cwd=path,
-            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        tar_stdout, tar_stderr = await tar_proc.communicate()
+            tar_args += ["--wildcards", "--no-wildcards-match-slash"] + ["*/%s" % p for p in limit_paths]
+        tar_proc = await asyncio.create_subprocess_exec(
+            'tar', *tar_args, cwd=path, stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE if return_filelist else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE)
+
+        async def pass_stdin():
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                async with self.stream_resource(url_path) as response:
+                    async for chunk in response.aiter_bytes(self.CHUNK_SIZE):
+                        tar_proc.stdin.write(decompressor.decompress(chunk))
+                        await tar_proc.stdin.drain()
+                tar_proc.stdin.write(decompressor.flush())
+                await tar_proc.stdin.drain()
+            except (httpx.HTTPError, zlib.error) as e:
+                raise DownloadError(f"Archive download failed from {self.base_url}/{url_path}: {e}")
+            except (BrokenPipeError, ConnectionResetError):
+                # Tar has exited early; its return code will say why.
+                pass
+            finally:
+                tar_proc.stdin.close()
+
+        async def read_stdout():
+            return await tar_proc.stdout.read() if return_filelist else b''
+
+        try:
+            _, tar_stdout, tar_stderr = await asyncio.gather(
+                pass_stdin(), read_stdout(), tar_proc.stderr.read())
+        except BaseException:
+            with contextlib.suppress(ProcessLookupError):
+                tar_proc.kill()
+            raise
+        finally:
+            await tar_proc.wait()
         if tar_proc.returncode != 0:
             raise DownloadError(f"Archive download failed from {self.base_url}/{url_path}")
-        filelist = [line.decode().split(os.path.sep, maxsplit=1)[1]
-                    for line in tar_stdout.splitlines()]
-        return filelist
+        if return_filelist:
+            return [line.partition(b'/')[2].decode() for line in tar_stdout.splitlines()]
 
     async def download_all_to(self, path, limit_paths=None):
         """
@@ -137,27 +232,33 @@ class GitHostTarballDownloader(GitDownloader):
 
 
 class GithubDownloader(GitHostTarballDownloader):
-    SERVER_REGEX = re.compile(r'^github\.com')
+    __slots__ = ()
+    SERVER_REGEX = re.compile(r'github\.com', re.ASCII)
     TARBALL_PATH = '{repo_path}/archive/{version}.tar.gz'
     FILE_PATH = '{repo_path}/raw/{version}/{path}'
 
 
 class BitbucketDownloader(GitHostTarballDownloader):
-    SERVER_REGEX = re.compile(r'^bitbucket\.org')
+    __slots__ = ()
+    SERVER_REGEX = re.compile(r'bitbucket\.org', re.ASCII)
     TARBALL_PATH = '{repo_path}/get/{version}.tar.gz'
     FILE_PATH = '{repo_path}/raw/{version}/{path}'
 
 
 class GitLabDownloader(GitHostTarballDownloader):
-    SERVER_REGEX = re.compile(r'^gitlab\.')
+    __slots__ = ()
+    SERVER_REGEX = re.compile(r'gitlab\.', re.ASCII)
     TARBALL_PATH = 'api/v4/projects/{repo_path_quoted}/repository/archive.tar.gz?sha={version}'
     FILE_PATH = 'api/v4/projects/{repo_path_quoted}/repository/files/{path_quoted}/raw?ref={version}'
     headers = {'Private-Token': os.environ.get('GITLAB_PRIVATE_TOKEN', '')}
 
 
 class GitLocalFileDownloader(GitDownloader):
+    __slots__ = ('repo_path', 'version')
+
     def __init__(self, repo_path, version):
         self.repo_path = repo_path
+        self.version = version
 
     async def get_file(self, path):
         git_cmd = ['git', 'show', f'{self.version}:{path}']
@@ -178,15 +279,16 @@ class GitRev:
     present are GitLab and Github, with some limited support for a local git clone (enough
     to use it as the rosdistro repo).
     """
-    URL_REGEX = re.compile(r'(?:\w+:\/\/|git@)(?P<server>[\w.-]+)[:/](?P<repo_path>[\w/\.-]*?)(?:\.git)?$')
+    __slots__ = ('descriptor', 'downloader', 'server', 'repo_path')
+    downloader: GitDownloader
+    URL_REGEX = re.compile(r'(?:\w+://|git@)(?P<server>[\w.-]+)[:/](?P<repo_path>[\w/.-]*?)(?:\.git)?', re.ASCII)
     URL_DOWNLOADERS = [GitLabDownloader, GithubDownloader, BitbucketDownloader]
-    FILE_REGEX = re.compile(r'file:\/\/(?P<repo_path>.+)$')
+    FILE_REGEX = re.compile(r'file://(?P<repo_path>.+)')
 
     def __init__(self, repository_descriptor: RepositoryDescriptor):
         self.descriptor = repository_descriptor
-        self.downloader: GitDownloader
         assert self.descriptor.url
-        if match := self.URL_REGEX.match(self.descriptor.url):
+        if match := self.URL_REGEX.fullmatch(self.descriptor.url):
             # Recognized remote hosts (Github, GitLab)
             self.server = match.group('server')
             self.repo_path = match.group('repo_path')
@@ -195,7 +297,7 @@ class GitRev:
                     self.downloader = dl_cls(
                         server=self.server, repo_path=self.repo_path, version=self.descriptor.version)
                     break
-        elif match := self.FILE_REGEX.match(self.descriptor.url):
+        elif match := self.FILE_REGEX.fullmatch(self.descriptor.url):
             # Repo on the local filesystem
             self.repo_path = match.group('repo_path')
             self.downloader = GitLocalFileDownloader(repo_path=self.repo_path,
@@ -1,4 +1,7 @@
-from collections import defaultdict
+from collections import deque
+import functools
+from itertools import groupby
+import orjson
 import requests
 
 from .package import descriptor_from_dict
@@ -8,25 +11,45 @@ class GeneratorError(RuntimeError):
     pass
 
 
+# Shared so that repeated fetches from the cache server reuse the same connection.
+_session = requests.Session()
+
+
+# Snapshots are immutable once generated, so callers which construct several Generators
+# in one process for the same snapshot can share a single fetch. The returned dict is
+# treated as read-only.
+@functools.lru_cache(maxsize=32)
+def _fetch_repositories(cache_url: str, rosdistro: str, ref: str):
+    url = f'{cache_url}/get/{rosdistro}/{ref}.json'
+    response = _session.get(url)
+    if not response.ok:
+        raise GeneratorError(
+            f"Unable to fetch from {cache_url}, got HTTP {response.status_code}.")
+    # Parse straight from the body bytes, which skips decoding a large snapshot to str.
+    return orjson.loads(response.content)['repositories']
+
+
 class Generator:
     def __init__(self, repositories_dict):
         self.repositories = repositories_dict
         self.packages = dict(self._all_packages())
         self.requested_packages = {}
 
+        # Names of each package's dependencies, across all types, which are themselves in
+        # the snapshot. This is the graph searched when recursive deps are requested.
+        self.dependency_graph = {
+            name: {dep.name for depset in pd.dependencies.values() for dep in depset
+                   if dep.name in self.packages}
+            for name, pd in self.packages.items()
+        }
+
     @classmethod
     def from_url_cache(cls, cache_url: str, rosdistro: str, ref: str):
         if not cache_url:
             raise GeneratorError("The cache URL must be supplied.")
         if not (rosdistro and ref):
             raise GeneratorError("The rosdistro name and git ref must be supplied.")
-        url = f'{cache_url}/get/{rosdistro}/{ref}.json'
-        response = requests.get(url)
-        if not response.ok:
-            raise GeneratorError(
-                f"Unable to fetch from {cache_url}, got HTTP {response.status_code}.")
-        response_json = response.json()
-        return cls(response_json['repositories'])
+        return cls(_fetch_repositories(cache_url, rosdistro, ref))
 
     def _all_packages(self):
         for repo_name, repo_dict in self.repositories.items():
@@ -40,38 +63,34 @@ class Generator:
         for pkg_name in pkg_names:
             packages.add(self.packages[pkg_name])
         if deps:
-            deps_packages = set()
-            for package in packages:
-                for depname in package.get_recursive_dependencies(self.packages.values()):
-                    deps_packages.add(self.packages[depname])
-            packages |= deps_packages
+            # One breadth-first search from all the requested packages together, rather
+            # than a separate recursive search from each of them.
+            found_names = set(pkg_names)
+            queue = deque(found_names)
+            while queue:
+                for depname in self.dependency_graph[queue.popleft()] - found_names:
+                    found_names.add(depname)
+                    queue.append(depname)
+                    packages.add(self.packages[depname])
         return packages
 
     def repositories_spec_from_descriptors(self, descriptors):
-        repo_packages = defaultdict(dict)
-        for package in descriptors:
-            repo_packages[package.metadata['repo_name']][package.name] = {
-                'path': str(package.path),
-                'type': package.type
-            }
+        # Sorting up front means each repo's entry can be built in one go, in final order.
+        def sort_key(package):
+            return package.metadata['repo_name'], package.name
 
         repositories_dict = {}
-        for repo_name in sorted(repo_packages):
+        for repo_name, packages in groupby(sorted(descriptors, key=sort_key), key=lambda p: p.metadata['repo_name']):
             cache_repo = self.repositories[repo_name]
             repositories_dict[repo_name] = {
                 'url': cache_repo['url'],
                 'type': cache_repo['type'],
                 'version': cache_repo['version'],
-                'packages': repo_packages[repo_name]
+                'packages': {p.name: {'path': str(p.path), 'type': p.type} for p in packages}
             }
         return repositories_dict
 
     def dependencies_from_descriptors(self, descriptors):
-        deps = set()
-        descriptor_names = set([desc.name for desc in descriptors])
-        for descriptor in descriptors:
-            for deptype, depset in descriptor.dependencies.items():
-                for dep in depset:
-                    if dep.name not in descriptor_names:
-                        deps.add(dep.name)
-        return deps
+        descriptor_names = {desc.name for desc in descriptors}
+        deps = {dep.name for desc in descriptors for depset in desc.dependencies.values() for dep in depset}
+        return deps - descriptor_names
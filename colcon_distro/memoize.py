@@ -11,8 +11,11 @@ def remember_progress(fn):
     """
     This decorator memoizes coroutines by wrapping them in futures and storing
     the result in a dictionary keyed to their name and arguments. The dict entry is cleared
-    as soon as the future completes because at that point the content is in the database
-    and would be retrieved from there anyway on successive calls.
+    as soon as the future completes, so this only deduplicates calls which overlap in time;
+    anything which should be reused after that is up to the wrapped coroutine and its
+    callers. For example, a scanned repo state isn't in the database until its whole set is
+    saved by :meth:`Database.insert_snapshot`, so until then :class:`Model` keeps it in its
+    ``unsaved_repo_states`` dict.
 
     The idea here is that if multiple calls for the same (or overlapping) snapshots come in
     concurrently, we don't do the same work twice. And more importantly, we don't violate
@@ -20,15 +23,18 @@ def remember_progress(fn):
 
     See also: https://en.wikipedia.org/wiki/Cache_stampede
     """
+    name = fn.__qualname__
+
     @functools.wraps(fn)
     async def wrapper(*args):
-        ident = (fn.__name__, *args)
-
-        async def _initial():
-            _in_progress[ident] = asyncio.ensure_future(fn(*args))
-            try:
-                return await _in_progress[ident]
-            finally:
-                del _in_progress[ident]
-        return await (_in_progress.get(ident) or _initial())
+        ident = (name, args)
+        future = _in_progress.get(ident)
+        if future is not None:
+            return await future
+
+        future = _in_progress[ident] = asyncio.ensure_future(fn(*args))
+        try:
+            return await future
+        finally:
+            del _in_progress[ident]
     return wrapper
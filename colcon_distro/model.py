@@ -6,16 +6,25 @@ This module provides the Model class, which is the main entry point to the
 backend of colcon-distro.
 """
 import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from typing import Dict
 import yaml
 
-from .database import RepositoryNotFound, RepositorySetNotFound
+from .database import DistroFileNotFound, RepositoryNotFound, RepositorySetNotFound
 from .discovery import discover_augmented_packages
 from .download import GitRev, DownloadError
 from .memoize import remember_progress
 from .repository_augmentation import augment_repository
 from .repository_descriptor import RepositoryDescriptor
 
+# The distribution.yaml files are large, so use the libyaml-backed loader when it's available.
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader  # type: ignore
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -36,6 +45,9 @@ class Model:
     be done and pauses requests for which the work is already in progress.
     """
 
+    # How many recently-requested sets to keep parsed in memory.
+    SET_CACHE_SIZE = 16
+
     def __init__(self, config, db):
         self.config = config
         self.db = db
@@ -43,7 +55,19 @@ class Model:
         # Limit how much work we try to do at once.
         self.semaphore = None
 
-    @remember_progress
+        # Package discovery and augmentation are synchronous, so they're kept off the loop, but
+        # colcon's extensions hold state between calls and aren't thread-safe, so all of the
+        # scans share a single worker thread.
+        self.scan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='colcon-distro-scan')
+
+        # Repo states which have been scanned but whose sets are not yet saved to the
+        # database, so that an overlapping set doesn't download and discover them again.
+        self.unsaved_repo_states: Dict[RepositoryDescriptor, RepositoryDescriptor] = {}
+
+        # Sets are immutable once saved, so the most recently used ones are kept already
+        # parsed, and repeat requests skip reading and decoding all their rows again.
+        self.set_cache: OrderedDict = OrderedDict()
+
     async def get_set(self, dist_name, ref):
         """
         Returns a set of repository descriptors, by fetching them from the database if possible,
@@ -54,9 +78,18 @@ class Model:
         :param ref: version control reference to fetch (currently only frozen tags and
             snapshots are supported).
         """
-        # Trim the ref prefix if included.
+        # Trim the ref prefix if included. This must happen ahead of the memoized call, so
+        # that concurrent requests for the same set with and without it share one future.
         if ref.startswith("refs/"):
-            ref = ref.split("refs/")[1]
+            ref = ref[len("refs/"):]
+        return await self._get_set(dist_name, ref)
+
+    @remember_progress
+    async def _get_set(self, dist_name, ref):
+        set_key = (dist_name, ref)
+        if set_key in self.set_cache:
+            self.set_cache.move_to_end(set_key)
+            return self.set_cache[set_key]
 
         # Check if we have it already in the database, returning as-is if so. Unfortunately
         # we do have to rebuild the list to parse the json, as tuples are immutable.
@@ -70,43 +103,92 @@ class Model:
             distro_descriptor.url = self.config.distro.repository
             distro_descriptor.type = 'git'
             distro_descriptor.version = ref
-            distro_rev = GitRev(distro_descriptor)
             try:
-                distro_rev.version = await distro_rev.version_hash_lookup()
+                distro_descriptor.version = await GitRev(distro_descriptor).version_hash_lookup()
             except DownloadError as e:
                 raise ModelError(f"Unable to access rosdistro: {e}")
-            distro_rev.downloader.version = distro_rev.version
-            index_yaml_str = await distro_rev.downloader.get_file(self.config.DIST_INDEX_YAML_FILE)
-            index_dict = yaml.safe_load(index_yaml_str)
+            distro_rev = GitRev(distro_descriptor)
+            index_dict = await self.get_distro_file(distro_rev, self.config.DIST_INDEX_YAML_FILE)
 
             if dist_name in index_dict['distributions']:
                 dist_file_path = index_dict['distributions'][dist_name]['distribution'][0]
             else:
                 raise ModelError(f"Unknown distro [{dist_name}] specified.")
-            distro_dict = yaml.safe_load(await distro_rev.downloader.get_file(dist_file_path))
+            distro_dict = await self.get_distro_file(distro_rev, dist_file_path)
 
-            def _get_repo_states():
-                """ Generate getter coroutines for all repo states. """
-                for repo_name, repo_dict in distro_dict['repositories'].items():
-                    if 'source' in repo_dict:
-                        desc = RepositoryDescriptor.from_distro(repo_name, repo_dict['source'])
-                        yield self.get_repo_state(desc)
+            source_descriptors = [
+                RepositoryDescriptor.from_distro(repo_name, repo_dict['source'])
+                for repo_name, repo_dict in distro_dict['repositories'].items()
+                if 'source' in repo_dict]
 
             logger.info(f"Preparing cache for {dist_name}:{ref}.")
-            repository_descriptors = await asyncio.gather(*_get_repo_states())
-
-            repo_state_ids = [desc.metadata['repo_state_id'] for desc in repository_descriptors]
-            await self.db.insert_set(dist_name, ref, repo_state_ids)
-            logger.info(f"Cache for {dist_name}:{ref} is now saved to the database")
+            try:
+                # All the repo states are waited for even if one fails, so that none of them is
+                # still adding itself to unsaved_repo_states after the cleanup below.
+                results = await asyncio.gather(
+                    *(self.get_repo_state(desc) for desc in source_descriptors), return_exceptions=True)
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+                repository_descriptors = results
+
+                # Freshly-scanned repo states are saved together with the set, in one transaction.
+                await self.db.insert_snapshot(dist_name, ref, repository_descriptors)
+                logger.info(f"Cache for {dist_name}:{ref} is now saved to the database")
+            finally:
+                # Either the repo states are now in the database, or the set failed and they
+                # are dropped rather than being held onto for the life of the process.
+                for desc in source_descriptors:
+                    self.unsaved_repo_states.pop(desc, None)
+
+        self.set_cache[set_key] = repository_descriptors
+        if len(self.set_cache) > self.SET_CACHE_SIZE:
+            self.set_cache.popitem(last=False)
         return repository_descriptors
 
+    async def get_set_summary(self, dist_name, ref):
+        """
+        Returns a list of (name, package count) tuples for the repositories in a set. If the
+        set is already in the database, this is answered without parsing the packages,
+        otherwise the set is generated with :meth:`get_set`.
+
+        :param dist_name: name of the distribution (eg, noetic)
+        :param ref: version control reference to fetch.
+        """
+        if ref.startswith("refs/"):
+            ref = ref[len("refs/"):]
+        try:
+            return await self.db.fetch_set_summary(dist_name, ref)
+        except RepositorySetNotFound:
+            repository_descriptors = await self._get_set(dist_name, ref)
+            return [(desc.name, len(desc.packages)) for desc in repository_descriptors]
+
+    async def get_distro_file(self, distro_rev: GitRev, path: str):
+        """
+        Returns the parsed contents of a YAML file from the rosdistro repo, by fetching it
+        from the database if possible, and otherwise downloading and parsing it, after
+        which it is saved in the database as JSON for next time.
+
+        :param distro_rev: The rosdistro GitRev, with the version already resolved to a hash.
+        :param path: Path of the file within the rosdistro repo.
+        """
+        repository = self.config.distro.repository
+        try:
+            return await self.db.fetch_distro_file(repository, distro_rev.descriptor.version, path)
+        except DistroFileNotFound:
+            yaml_str = await distro_rev.downloader.get_file(path)
+            file_dict = yaml.load(yaml_str, Loader=SafeLoader)
+            await self.db.insert_distro_file(repository, distro_rev.descriptor.version, path, file_dict)
+            return file_dict
+
     @remember_progress
     async def get_repo_state(self, repository_descriptor: RepositoryDescriptor):
         """
         Populates the passed repository_descriptor with PackageDescriptor instances
-        in the packages set, and a repo_state_id field in the metadata dict. This may happen
-        because all of the information was in the cache, or some or all of it may have
-        to have been pulled from the original source.
+        in the packages set. This may happen because all of the information was in the cache,
+        in which case the metadata dict also gets a repo_state_id field, or it may have to have
+        been pulled from the original source, in which case the caller is responsible for
+        saving it with :meth:`Database.insert_snapshot`.
 
         :param repository_descriptor: The descriptor object to populate with information
             about its state. Must include name, type, url, and version fields.
@@ -119,19 +201,24 @@ class Model:
         try:
             await self.db.fetch_repo_state(repository_descriptor)
         except RepositoryNotFound:
+            # It may have been scanned already for another set which isn't saved yet.
+            if repository_descriptor in self.unsaved_repo_states:
+                return self.unsaved_repo_states[repository_descriptor]
+
             # If not, grab the source and find the package descriptors, modifying
             # each so the path is relative to the repo rather than absolute.
+            def _scan():
+                repository_descriptor.packages = \
+                    discover_augmented_packages(repository_descriptor.path)
+                augment_repository(repository_descriptor)
+
             self.semaphore = self.semaphore or asyncio.Semaphore(self.config.get_parallelism())
             async with self.semaphore:
                 try:
                     async with GitRev(repository_descriptor).tempdir_download():
-                        repository_descriptor.packages = \
-                            discover_augmented_packages(repository_descriptor.path)
-                        augment_repository(repository_descriptor)
+                        await asyncio.get_running_loop().run_in_executor(self.scan_executor, _scan)
                 except DownloadError:
                     repository_descriptor.packages = []
                     logger.exception('')
-
-            # Insert it as a new row, which will set the repo_state_id metadata on it.
-            await self.db.insert_repo_state(repository_descriptor)
+            self.unsaved_repo_states[repository_descriptor] = repository_descriptor
         return repository_descriptor
@@ -12,6 +12,10 @@ from typing import Optional, Set
 # TODO: This needs to consult the config for any allowlisted metadata that should be included
 # in the serialization.
 
+# Dependency types which are kept when serializing; any others are dropped.
+SERIALIZED_DEPENDENCY_TYPES = frozenset(('build', 'run', 'test'))
+
+
 def dependency_str(dep):
     if isinstance(dep, DependencyDescriptor):
         return dep.name
@@ -28,11 +32,9 @@ def descriptor_to_dict(pd: PackageDescriptor, metadata_inclusions: Optional[Set]
     }
 
     package_dict['depends'] = {}
-    for deptype in ('build', 'run', 'test'):
-        if deptype in pd.dependencies and pd.dependencies[deptype]:
-            dependency_strs = [dependency_str(dep) for dep in pd.dependencies[deptype]]
-            dependency_strs.sort()
-            package_dict['depends'][deptype] = dependency_strs
+    for deptype, depset in pd.dependencies.items():
+        if depset and deptype in SERIALIZED_DEPENDENCY_TYPES:
+            package_dict['depends'][deptype] = sorted(dependency_str(dep) for dep in depset)
 
     # Only include the metadata dict if a set of inclusions has specifically been passed, since
     # including everything by default would end up with junk in some cases, like ros.catkin
@@ -50,8 +52,9 @@ def descriptor_from_dict(d: dict):
     pd = PackageDescriptor(d['path'])
     pd.name = d['name']
     pd.type = d['type']
+    # Copied, as the dict may be shared (eg, a cached response) and callers add to the metadata.
     with suppress(KeyError):
-        pd.metadata = d['metadata']
+        pd.metadata = dict(d['metadata'])
     for deptype, deplist in d['depends'].items():
         for depname in deplist:
             pd.dependencies[deptype].add(DependencyDescriptor(depname))
@@ -1,5 +1,11 @@
 PRAGMA foreign_keys = ON;
 
+/*
+Every statement in this script is idempotent, as it is also run against existing
+databases at startup, which is how tables added since a database was created (such
+as distro_files) get created in it.
+*/
+
 /*
 Each row corresponds to a repository at a particular moment in time, identified
 by the version field, which should be a hash or tag name in the git case. If
@@ -23,7 +29,7 @@ If needed, the package_descriptors could go to a separate many-many table, but
 this would be purely a deduplication for disk savings; not worth the complexity
 in the short term.
 */
-CREATE TABLE repo_states (
+CREATE TABLE IF NOT EXISTS repo_states (
     id INTEGER PRIMARY KEY,
     name VARCHAR(64) NOT NULL,
     type VARCHAR(4) NOT NULL,
@@ -33,7 +39,7 @@ CREATE TABLE repo_states (
     package_descriptors TEXT NOT NULL
 );
 
-CREATE UNIQUE INDEX repo_state_index ON repo_states(name, type, url, version);
+CREATE UNIQUE INDEX IF NOT EXISTS repo_state_index ON repo_states(name, type, url, version);
 
 /*
 Each repo set corresponds to a moment in time for the distro repo. If this is an
@@ -46,14 +52,14 @@ repo_states rows should still be hashes, not branch names. Note that this does
 mean branch names are not stored at all, but this does not matter, since a new
 copy of the distribution.yaml would need to be fetched anyway.
 */
-CREATE TABLE sets (
+CREATE TABLE IF NOT EXISTS sets (
     id INTEGER PRIMARY KEY,
     dist VARCHAR(16) NOT NULL,
     ref VARCHAR(64) NOT NULL,
     last_updated DATETIME
 );
 
-CREATE UNIQUE INDEX set_names ON sets(ref, dist);
+CREATE UNIQUE INDEX IF NOT EXISTS set_names ON sets(ref, dist);
 
 /*
 Join table for mapping sets and repo states together. These are added last, and
@@ -61,10 +67,25 @@ the intention of the foreign key constraints are that a) deleted sets will autom
 clean up their associated set_repo_states, and b) repo_states rows will not be removable
 until all the sets using them have also been deleted.
 */
-CREATE TABLE set_repo_states (
+CREATE TABLE IF NOT EXISTS set_repo_states (
     set_id INTEGER NOT NULL,
     repo_state_id INTEGER NOT NULL,
     FOREIGN KEY(set_id) REFERENCES sets(id) ON DELETE CASCADE,
     FOREIGN KEY(repo_state_id) REFERENCES repo_states(id) ON DELETE RESTRICT,
     UNIQUE(set_id, repo_state_id) ON CONFLICT ABORT
 );
+
+
+/*
+Cache of files from the rosdistro repo itself (index.yaml, distribution.yaml), keyed
+to the resolved hash of the repo. These are parsed from YAML once when first fetched
+and then stored as JSON, so that later snapshots at the same distro version skip both
+the download and the much slower YAML parse.
+*/
+CREATE TABLE IF NOT EXISTS distro_files (
+    repository VARCHAR(256) NOT NULL,
+    version VARCHAR(40) NOT NULL,
+    path VARCHAR(256) NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY(repository, version, path)
+);
@@ -16,6 +16,7 @@ import yaml
 
 from .config import add_config_args, get_config
 from .database import Database
+from .download import close_http_client
 from .model import Model, ModelError
 from .vendor.compress import Compress
 
@@ -113,13 +114,17 @@ def main():
     app.ctx.model = Model(config, db)
 
     async def run_server():
-        server = await app.create_server(
-            host=args.host,
-            port=args.port,
-            return_asyncio_server=True
-        )
-        await server.startup()
-        return await server.serve_forever()
+        try:
+            async with db:
+                server = await app.create_server(
+                    host=args.host,
+                    port=args.port,
+                    return_asyncio_server=True
+                )
+                await server.startup()
+                return await server.serve_forever()
+        finally:
+            await close_http_client()
 
     try:
         asyncio.run(run_server())
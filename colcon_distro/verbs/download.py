@@ -11,6 +11,11 @@ import os
 import pathlib
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader  # type: ignore
+
 # TODO: Why isn't this working?
 import colcon_output.event_handler.summary
 colcon_output.event_handler.summary.get_job_type_word_form = lambda n: 'repository' if n == 1 else 'repositories'
@@ -24,7 +29,7 @@ class DownloadVerb(VerbExtensionPoint):
         async def __call__(self):
             # Lazy-import this so we don't pay the cost of importing
             # its dependencies when it isn't used.
-            from colcon_distro.download import GitRev
+            from colcon_distro.download import close_http_client, GitRev
             spec = self.context.repo_spec
             package_paths = [p['path'] for p in spec['packages'].values()]
             path = self.context.src_path / self.context.repo_name
@@ -34,7 +39,14 @@ class DownloadVerb(VerbExtensionPoint):
             distro_descriptor.type = 'git'
             distro_descriptor.version = spec['version']
             gitrev = GitRev(distro_descriptor)
-            await gitrev.downloader.download_all_to(path, limit_paths=package_paths)
+            try:
+                await gitrev.downloader.download_all_to(path, limit_paths=package_paths)
+            finally:
+                # The jobs all share one http client, which the last of them to finish closes.
+                pending_repos = self.context.pending_repos
+                pending_repos.discard(self.context.repo_name)
+                if not pending_repos:
+                    await close_http_client()
 
     def __init__(self):  # noqa: D107
         super().__init__()
@@ -50,19 +62,21 @@ class DownloadVerb(VerbExtensionPoint):
     def main(self, *, context):  # noqa: D102
         src_path = pathlib.Path(os.path.abspath(context.args.src_base))
 
-        with open(context.args.input_file) as f:
-            repositories = yaml.safe_load(f)['repositories']
+        with open(context.args.input_file, 'rb') as f:
+            repositories = yaml.load(f, Loader=SafeLoader)['repositories']
 
         class Dummy:
             def __init__(self, name):
                 self.name = name
 
         jobs = {}
+        pending_repos = set(repositories)
         for repo_name, repo_spec in repositories.items():
             task_context = TaskContext(args=context.args, pkg=Dummy(repo_name), dependencies=set())
             task_context.repo_name = repo_name
             task_context.repo_spec = repo_spec
             task_context.src_path = src_path
+            task_context.pending_repos = pending_repos
 
             job = Job(
                 identifier=repo_name,
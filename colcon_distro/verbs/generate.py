@@ -4,6 +4,11 @@ from colcon_core.verb import VerbExtensionPoint
 import os
 import yaml
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:  # pragma: no cover
+    from yaml import SafeDumper  # type: ignore
+
 
 class GenerateVerb(VerbExtensionPoint):
     def __init__(self):  # noqa: D107
@@ -46,5 +51,5 @@ class GenerateVerb(VerbExtensionPoint):
             'dependencies': sorted(generator.dependencies_from_descriptors(descriptors))
         }
         with open(context.args.output_file, 'w') as f:
-            f.write(yaml.dump(output_dict, sort_keys=False))
+            f.write(yaml.dump(output_dict, Dumper=SafeDumper, sort_keys=False))
         return 0
@@ -0,0 +1,126 @@
+from colcon_distro.database import Database, DistroFileNotFound, RepositorySetNotFound
+from colcon_distro.repository_descriptor import RepositoryDescriptor
+
+import asyncio
+from pathlib import Path
+import sqlite3
+from tempfile import TemporaryDirectory
+
+import pytest
+
+
+class DummyConfig:
+    def __init__(self, config_dir):
+        self.dir = config_dir
+
+    def get_database_filepath(self):
+        return self.dir / 'distro.db'
+
+    def get_parallelism(self):
+        return 2
+
+    def get_metadata_inclusions(self):
+        return set()
+
+
+def _descriptor(name, version, package_names):
+    desc = RepositoryDescriptor.from_distro(name, {'type': 'git', 'url': f'https://example.com/{name}.git',
+                                                   'version': version})
+    desc.parse_packages_dicts([{'name': n, 'path': n, 'type': 'ros.catkin', 'depends': {}} for n in package_names])
+    return desc
+
+
+def test_database_distro_files():
+    with TemporaryDirectory() as tmpdir:
+        config = DummyConfig(Path(tmpdir))
+        database = Database(config)
+        content = {'repositories': {'roscpp': {'source': {'type': 'git'}}}, 'version': 2}
+
+        async def round_trip():
+            async with database:
+                with pytest.raises(DistroFileNotFound):
+                    await database.fetch_distro_file('file:///distro', 'abc', 'index.yaml')
+                await database.insert_distro_file('file:///distro', 'abc', 'index.yaml', content)
+                # A second insert of the same file is ignored.
+                await database.insert_distro_file('file:///distro', 'abc', 'index.yaml', {})
+                return await database.fetch_distro_file('file:///distro', 'abc', 'index.yaml')
+
+        assert asyncio.run(round_trip()) == content
+
+
+def test_database_adds_missing_tables():
+    with TemporaryDirectory() as tmpdir:
+        config = DummyConfig(Path(tmpdir))
+        Database(config)
+
+        # Mimic a database created before the distro_files table was added to the schema.
+        db = sqlite3.connect(config.get_database_filepath())
+        db.execute('DROP TABLE distro_files')
+        db.commit()
+        db.close()
+
+        database = Database(config)
+
+        async def fetch():
+            async with database:
+                await database.fetch_distro_file('file:///distro', 'abc', 'index.yaml')
+
+        with pytest.raises(DistroFileNotFound):
+            asyncio.run(fetch())
+
+
+def test_database_set_summary():
+    with TemporaryDirectory() as tmpdir:
+        database = Database(DummyConfig(Path(tmpdir)))
+        descs = [_descriptor('bar', 'abc', ['bar']), _descriptor('foo', 'def', ['foo', 'foo_msgs'])]
+
+        async def summarize():
+            async with database:
+                await database.insert_snapshot('banana', 'tags/t1', descs)
+                with pytest.raises(RepositorySetNotFound):
+                    await database.fetch_set_summary('banana', 'tags/t2')
+                return await database.fetch_set_summary('banana', 'tags/t1')
+
+        assert asyncio.run(summarize()) == [('bar', 1), ('foo', 2)]
+
+
+def test_database_snapshot_rollback():
+    with TemporaryDirectory() as tmpdir:
+        database = Database(DummyConfig(Path(tmpdir)))
+        bar = _descriptor('bar', 'abc', ['bar'])
+        foo = _descriptor('foo', 'def', ['foo'])
+
+        async def insert_twice():
+            async with database:
+                await database.insert_snapshot('banana', 'tags/t1', [bar])
+                bar_id = bar.metadata['repo_state_id']
+
+                # The set already exists, so this fails after foo's repo state is inserted.
+                with pytest.raises(sqlite3.IntegrityError):
+                    await database.insert_snapshot('banana', 'tags/t1', [bar, foo])
+                assert bar.metadata['repo_state_id'] == bar_id
+                assert 'repo_state_id' not in foo.metadata
+
+                # The writer is left usable for the next snapshot.
+                await database.insert_snapshot('banana', 'tags/t2', [bar, foo])
+                return await database.fetch_set('banana', 'tags/t2')
+
+        assert asyncio.run(insert_twice()) == [bar, foo]
+
+
+def test_database_cache_size():
+    with TemporaryDirectory() as tmpdir:
+        database = Database(DummyConfig(Path(tmpdir)))
+
+        async def cache_sizes():
+            async with database:
+                async with database.pool.writer() as db:
+                    writer_rows = await db.execute_fetchall('PRAGMA cache_size')
+                async with database.pool.reader() as db:
+                    reader_rows = await db.execute_fetchall('PRAGMA cache_size')
+                return writer_rows[0][0], reader_rows[0][0]
+
+        # Only the writer gets the large cache, since it is allocated per connection.
+        writer_size, reader_size = asyncio.run(cache_sizes())
+        assert writer_size == -64000
+        assert reader_size != writer_size
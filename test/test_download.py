@@ -0,0 +1,125 @@
+from colcon_distro.download import close_http_client, DownloadError, get_http_client, GitHostTarballDownloader
+
+import asyncio
+import contextlib
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import io
+from pathlib import Path
+import re
+import tarfile
+from tempfile import TemporaryDirectory
+import threading
+
+import pytest
+
+
+class LocalDownloader(GitHostTarballDownloader):
+    __slots__ = ()
+    SERVER_REGEX = re.compile(r'127\.0\.0\.1')
+    BASE_URL = 'http://{server}'
+    TARBALL_PATH = '{repo_path}/{version}.tar.gz'
+    FILE_PATH = '{repo_path}/{version}/{path}'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+REPO_FILES = {
+    'README.md': b'readme',
+    'foo/package.xml': b'<package/>',
+    'foo_msgs/package.xml': b'<package/>',
+}
+
+
+@contextlib.contextmanager
+def serve_repo():
+    """
+    Serves a tarball of REPO_FILES as the 'abc' version of 'org/repo', as well as the loose
+    files themselves, from a local server. Yields the server's host and port.
+    """
+    with TemporaryDirectory() as tmpdir:
+        repo_dir = Path(tmpdir) / 'org' / 'repo'
+        for name, content in REPO_FILES.items():
+            (repo_dir / 'abc' / name).parent.mkdir(parents=True, exist_ok=True)
+            (repo_dir / 'abc' / name).write_bytes(content)
+        with tarfile.open(repo_dir / 'abc.tar.gz', 'w:gz') as tar:
+            for name, content in REPO_FILES.items():
+                info = tarfile.TarInfo(f'repo-abc/{name}')
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=tmpdir))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            yield '%s:%d' % server.server_address
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+def _run(coro):
+    async def run_and_close():
+        try:
+            return await coro
+        finally:
+            await close_http_client()
+    return asyncio.run(run_and_close())
+
+
+def _extracted(path):
+    return sorted(str(p.relative_to(path)) for p in path.rglob('*') if p.is_file())
+
+
+def test_download_all_to():
+    with serve_repo() as server, TemporaryDirectory() as dest:
+        downloader = LocalDownloader(server, 'org/repo', 'abc')
+        _run(downloader.download_all_to(dest))
+        assert _extracted(Path(dest)) == sorted(REPO_FILES)
+
+
+def test_extract_limit_paths():
+    with serve_repo() as server, TemporaryDirectory() as dest:
+        downloader = LocalDownloader(server, 'org/repo', 'abc')
+        filelist = _run(downloader.extract_tarball_to(dest, limit_paths=['foo'], return_filelist=True))
+        assert _extracted(Path(dest)) == ['foo/package.xml']
+        assert 'foo/package.xml' in filelist
+        assert 'foo_msgs/package.xml' not in filelist
+
+
+def test_get_file():
+    with serve_repo() as server:
+        downloader = LocalDownloader(server, 'org/repo', 'abc')
+        assert _run(downloader.get_file('foo/package.xml')) == b'<package/>'
+
+
+def test_download_not_found():
+    with serve_repo() as server, TemporaryDirectory() as dest:
+        downloader = LocalDownloader(server, 'org/repo', 'def')
+        with pytest.raises(DownloadError):
+            _run(downloader.download_all_to(dest))
+        with pytest.raises(DownloadError):
+            _run(downloader.get_file('foo/package.xml'))
+
+
+def test_http_client_per_loop():
+    async def use_client():
+        client = get_http_client()
+        assert get_http_client() is client
+        return client
+
+    # A client from an earlier loop is not reused, since its connections were bound to it.
+    first = asyncio.run(use_client())
+    second = asyncio.run(use_client())
+    assert first is not second
+
+    async def close_client():
+        client = get_http_client()
+        await close_http_client()
+        return client
+
+    assert asyncio.run(close_client()).is_closed
@@ -1,6 +1,8 @@
 from colcon_core.command import main as colcon_main
+from colcon_distro.generate import Generator
 from tempfile import TemporaryDirectory
 
+import copy
 import os
 import responses
 import yaml
@@ -41,3 +43,17 @@ def test_call_generate():
             y = yaml.safe_load(f)
             assert y['repositories']['foo']['url'] == 'url/to/foo'
     os.chdir(cwd)
+
+
+@responses.activate
+def test_generator_leaves_cached_response_unchanged():
+    metadata_response = copy.deepcopy(response)
+    metadata_response['repositories']['foo']['packages'][0]['metadata'] = {'maintainer': 'someone'}
+    responses.add(responses.GET, 'http://example.com/get/banana/meta.json', json=metadata_response)
+
+    # The fetched repositories are cached and shared between generators, so the repo_name
+    # added to each package's metadata must not find its way back into them.
+    Generator.from_url_cache('http://example.com', 'banana', 'meta')
+    generator = Generator.from_url_cache('http://example.com', 'banana', 'meta')
+    assert generator.packages['baz'].metadata['repo_name'] == 'foo'
+    assert generator.repositories == metadata_response['repositories']
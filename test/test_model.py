@@ -1,15 +1,21 @@
 
 from colcon_distro.config import Config, DistroConfig
 from colcon_distro.database import Database
+from colcon_distro.download import GitRev
 from colcon_distro.model import Model
+from colcon_distro.repository_descriptor import RepositoryDescriptor
 
 import asyncio
+import contextlib
 import logging
 from pathlib import Path
 from shutil import copytree
+import sqlite3
 from subprocess import check_output
 from tempfile import TemporaryDirectory
 
+import pytest
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -55,12 +61,99 @@ def test_model_github_hashes():
         database = Database(config)
         model = Model(config, database)
 
+        async def get_set(model):
+            async with database:
+                return await model.get_set('banana', 'roscpp-github-hashes')
+
         # This call will cause the repos in the distribution to be cached.
-        descriptors = asyncio.run(model.get_set('banana', 'roscpp-github-hashes'))
+        descriptors = asyncio.run(get_set(model))
         assert len(descriptors) == 16
 
         # This one will return from the database, so we want to confirm that it's an
-        # identical result to the above.
+        # identical result to the above. A fresh Model is used so that the set doesn't
+        # just come from the in-memory cache.
         # TODO: Somehow confirm that it doesn't re-fetch anything. Check logging maybe?
-        descriptors2 = asyncio.run(model.get_set('banana', 'roscpp-github-hashes'))
+        descriptors2 = asyncio.run(get_set(Model(config, database)))
         assert descriptors == descriptors2
+
+        # And finally from the in-memory cache of the original Model.
+        assert asyncio.run(get_set(model)) is descriptors
+
+
+PACKAGE_XML = """<?xml version="1.0"?>
+<package format="2">
+  <name>{name}</name>
+  <version>0.0.0</version>
+  <description>{name}</description>
+  <maintainer email="dummy@example.com">Dummy</maintainer>
+  <license>BSD</license>
+  <buildtool_depend>catkin</buildtool_depend>
+</package>
+"""
+
+
+def test_model_concurrent_scans(monkeypatch):
+    with TemporaryDirectory() as tmpdir:
+        config = DummyConfig(Path(tmpdir))
+        repos_dir = Path(tmpdir) / 'repos'
+        expected = {}
+        for r in range(8):
+            repo_name = f'repo{r}'
+            expected[repo_name] = {f'{repo_name}_pkg{p}' for p in range(4)}
+            for pkg_name in expected[repo_name]:
+                pkg_dir = repos_dir / repo_name / pkg_name
+                pkg_dir.mkdir(parents=True)
+                (pkg_dir / 'package.xml').write_text(PACKAGE_XML.format(name=pkg_name))
+                (pkg_dir / 'CMakeLists.txt').touch()
+
+        # Stand in for the download, pointing each repo at its directory prepared above.
+        @contextlib.asynccontextmanager
+        async def tempdir_download(self):
+            self.descriptor.path = repos_dir / self.descriptor.name
+            yield
+            self.descriptor.path = None
+        monkeypatch.setattr(GitRev, 'tempdir_download', tempdir_download)
+
+        database = Database(config)
+        model = Model(config, database)
+        descs = [RepositoryDescriptor.from_distro(name, {
+            'type': 'git', 'url': f'https://github.com/org/{name}.git', 'version': 'abc'}) for name in expected]
+
+        async def get_repo_states():
+            async with database:
+                return await asyncio.gather(*(model.get_repo_state(desc) for desc in descs))
+
+        # The repos are all scanned at once, and none may end up with another's packages.
+        for desc in asyncio.run(get_repo_states()):
+            assert {pd.name for pd in desc.packages} == expected[desc.name]
+            assert {str(pd.path) for pd in desc.packages} == expected[desc.name]
+
+
+def test_model_failed_set_cleanup(monkeypatch):
+    with TemporaryDirectory() as tmpdir:
+        config = DummyConfig(Path(tmpdir))
+        config.add_state('roscpp-github-hashes')
+
+        # Stand in for the downloads with an empty directory, so that there's nothing to scan.
+        @contextlib.asynccontextmanager
+        async def tempdir_download(self):
+            self.descriptor.path = Path(tmpdir)
+            yield
+            self.descriptor.path = None
+        monkeypatch.setattr(GitRev, 'tempdir_download', tempdir_download)
+
+        database = Database(config)
+        model = Model(config, database)
+
+        async def insert_snapshot(*args):
+            raise sqlite3.OperationalError('database is locked')
+        monkeypatch.setattr(database, 'insert_snapshot', insert_snapshot)
+
+        async def get_set():
+            async with database:
+                await model.get_set('banana', 'roscpp-github-hashes')
+
+        # The scanned repo states aren't held onto when their set fails to save.
+        with pytest.raises(sqlite3.OperationalError):
+            asyncio.run(get_set())
+        assert not model.unsaved_repo_states